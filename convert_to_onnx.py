@@ -1,29 +1,27 @@
 import argparse
 import torch
 import torch.nn as nn
-from torchvision import transforms
-from PIL import Image
-from src.model.pytorch_model import PyTorchModel
+import torch.nn.functional as F
+from pytorch_model import Classifier
+from src.utils.convert_to_onnx import IMAGENET_MEAN, IMAGENET_STD, load_weights, optimize_onnx_model
 
 class PreprocessingModel(nn.Module):
-    def __init__(self, model):
+    def __init__(self, model, size=(224, 224)):
         super().__init__()
         self.model = model
-        self.resize = transforms.Resize((224, 224))
-        self.crop = transforms.CenterCrop((224, 224))
-        self.to_tensor = transforms.ToTensor()
-        self.normalize = transforms.Normalize(
-            mean=[0.485, 0.456, 0.406],
-            std=[0.229, 0.224, 0.225]
-        )
+        self.size = size
+        # (x / 255 - mean) / std as a single per-channel Mul + Add
+        std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+        mean = torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1)
+        self.register_buffer('scale', 1.0 / (255.0 * std))
+        self.register_buffer('bias', -mean / std)
 
     def forward(self, x):
-        # Input is expected to be a PIL Image
-        x = self.resize(x)
-        x = self.crop(x)
-        x = self.to_tensor(x)
-        x = self.normalize(x)
-        x = x.unsqueeze(0)  # Add batch dimension
+        # Input is a batch of decoded uint8 RGB images with shape (N, H, W, 3)
+        x = x.permute(0, 3, 1, 2).float()
+        # Antialiased like PIL's bilinear resize; exports as Resize(antialias=1), opset 18+
+        x = F.interpolate(x, size=self.size, mode='bilinear', align_corners=False, antialias=True)
+        x = x * self.scale + self.bias
         return self.model(x)
 
 def convert_to_onnx(model_path: str, output_path: str, include_preprocessing: bool = True):
@@ -36,18 +34,20 @@ def convert_to_onnx(model_path: str, output_path: str, include_preprocessing: bo
         include_preprocessing (bool): Whether to include preprocessing in ONNX model
     """
     # Load PyTorch model
-    model = PyTorchModel()
-    model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
+    model = Classifier()
+    model.load_state_dict(load_weights(model_path))
     model.eval()
     
     if include_preprocessing:
         # Wrap model with preprocessing
-        model = PreprocessingModel(model)
-        # Create dummy input (PIL Image)
-        dummy_input = Image.new('RGB', (224, 224), color='red')
+        model = PreprocessingModel(model).eval()
+        # Create dummy input (raw decoded uint8 image, any size)
+        dummy_input = torch.zeros(1, 480, 640, 3, dtype=torch.uint8)
+        input_axes = {0: 'batch_size', 1: 'height', 2: 'width'}
     else:
         # Create dummy input tensor
         dummy_input = torch.randn(1, 3, 224, 224)
+        input_axes = {0: 'batch_size'}
     
     # Export to ONNX
     torch.onnx.export(
@@ -55,16 +55,19 @@ def convert_to_onnx(model_path: str, output_path: str, include_preprocessing: bo
         dummy_input,
         output_path,
         export_params=True,
-        opset_version=12,
+        opset_version=18,
         do_constant_folding=True,
         input_names=['input'],
         output_names=['output'],
         dynamic_axes={
-            'input': {0: 'batch_size'},
+            'input': input_axes,
             'output': {0: 'batch_size'}
         }
     )
     
+    # Simplify, fuse BN/bias ops and drop dead nodes left after export
+    optimize_onnx_model(output_path)
+    
     print(f"Model converted and saved to {output_path}")
     if include_preprocessing:
         print("Preprocessing steps are included in the ONNX model")
@@ -82,4 +85,4 @@ def main():
     convert_to_onnx(args.model_path, args.output_path, args.include_preprocessing)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
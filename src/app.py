@@ -1,16 +1,18 @@
+import asyncio
+import concurrent.futures
+import hmac
 import os
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import uvicorn
 from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import numpy as np
-from PIL import Image
-import io
 from datetime import datetime
 
-from src.model.model import ONNXModel
+from src.model.model import get_model
+from src.utils.batching import MicroBatcher
 
 # Initialize FastAPI app with Cerebrium-specific metadata
 app = FastAPI(
@@ -32,22 +34,41 @@ app.add_middleware(
 
 # Get Cerebrium-specific environment variables
 API_KEY = os.getenv("CEREBRIUM_API_KEY", "")
+API_KEY_BYTES = API_KEY.encode()
 MODEL_PATH = os.getenv("CEREBRIUM_MODEL_PATH", "model.onnx")
 WORKERS = int(os.getenv("CEREBRIUM_WORKERS", "1"))
 TIMEOUT = int(os.getenv("CEREBRIUM_TIMEOUT", "60"))
+MAX_BATCH_SIZE = int(os.getenv("CEREBRIUM_MAX_BATCH_SIZE", "8"))
+MAX_BATCH_LATENCY_MS = float(os.getenv("CEREBRIUM_MAX_BATCH_LATENCY_MS", "5"))
+PREPROC_WORKERS = int(os.getenv("CEREBRIUM_PREPROC_WORKERS", "4"))
+MAX_BATCH_FILES = int(os.getenv("CEREBRIUM_MAX_BATCH_FILES", "64"))
 
 # Initialize model
-model = ONNXModel(MODEL_PATH)
+model = get_model(MODEL_PATH)
+
+# Thread pool for CPU-bound decode/preprocess and inference, keeping the event loop free
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=PREPROC_WORKERS)
+
+# Coalesce concurrent uploads into batched ORT calls (disabled when max batch size is 1)
+batcher = MicroBatcher(model.predict_preprocessed, MAX_BATCH_SIZE, MAX_BATCH_LATENCY_MS, EXECUTOR)
 
 # Track API usage
 api_stats = {
     "total_requests": 0,
     "successful_requests": 0,
     "failed_requests": 0,
-    "average_response_time": 0,
+    "total_response_time": 0.0,
     "last_request_time": None
 }
 
+def stats_snapshot() -> Dict:
+    """Copy of api_stats with the average response time derived from the running total."""
+    successful = api_stats["successful_requests"]
+    return {
+        **api_stats,
+        "average_response_time": api_stats["total_response_time"] / successful if successful else 0
+    }
+
 async def verify_api_key(authorization: Optional[str] = Header(None)):
     """Verify API key from header."""
     if not API_KEY:
@@ -59,22 +80,17 @@ async def verify_api_key(authorization: Optional[str] = Header(None)):
             detail="API key is required"
         )
     
-    try:
-        scheme, key = authorization.split()
-        if scheme.lower() != "bearer":
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid authentication scheme"
-            )
-        if key != API_KEY:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid API key"
-            )
-    except ValueError:
+    # Scheme match is case-insensitive and extra spaces around the key are
+    # ignored, as with a whitespace split; the key comparison is constant-time
+    if authorization[:7].lower() != "bearer ":
         raise HTTPException(
             status_code=401,
-            detail="Invalid authorization header"
+            detail="Invalid authentication scheme"
+        )
+    if not hmac.compare_digest(authorization[7:].strip().encode(), API_KEY_BYTES):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid API key"
         )
     
     return True
@@ -86,11 +102,15 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "model_loaded": model is not None,
-        "api_stats": api_stats,
+        "api_stats": stats_snapshot(),
         "environment": {
             "workers": WORKERS,
             "timeout": TIMEOUT,
-            "model_path": MODEL_PATH
+            "model_path": MODEL_PATH,
+            "max_batch_size": MAX_BATCH_SIZE,
+            "max_batch_latency_ms": MAX_BATCH_LATENCY_MS,
+            "preproc_workers": PREPROC_WORKERS,
+            "max_batch_files": MAX_BATCH_FILES
         }
     }
 
@@ -109,7 +129,7 @@ async def metrics():
     """Endpoint for monitoring metrics."""
     return {
         "timestamp": datetime.utcnow().isoformat(),
-        "api_stats": api_stats,
+        "api_stats": stats_snapshot(),
         "model_info": {
             "path": MODEL_PATH,
             "loaded": model is not None
@@ -135,38 +155,92 @@ async def predict(
     api_stats["last_request_time"] = datetime.utcnow().isoformat()
     
     try:
-        # Read and validate image
+        # Preprocess off the event loop, then join the next batched forward pass
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        loop = asyncio.get_running_loop()
+        input_data = await loop.run_in_executor(EXECUTOR, model.preprocessor.preprocess_bytes, contents)
+        if MAX_BATCH_SIZE > 1:
+            class_id, confidence = await batcher.submit(input_data)
+        else:
+            class_id, confidence = await loop.run_in_executor(EXECUTOR, model.predict_array, input_data)
         
-        # Save temporarily for preprocessing
-        temp_path = f"/tmp/{file.filename}"
-        image.save(temp_path)
+        # Update stats
+        # No await between these updates, so concurrent requests cannot interleave them
+        response_time = time.time() - start_time
+        api_stats["successful_requests"] += 1
+        api_stats["total_response_time"] += response_time
         
-        try:
-            # Make prediction
-            class_id, confidence = model.predict(temp_path)
-            
-            # Update stats
-            api_stats["successful_requests"] += 1
-            response_time = time.time() - start_time
-            api_stats["average_response_time"] = (
-                (api_stats["average_response_time"] * (api_stats["successful_requests"] - 1) + response_time)
-                / api_stats["successful_requests"]
-            )
-            
-            return {
-                "class_id": int(class_id),
-                "confidence": float(confidence),
-                "filename": file.filename,
-                "processing_time": response_time
-            }
+        return {
+            "class_id": int(class_id),
+            "confidence": float(confidence),
+            "filename": file.filename,
+            "processing_time": response_time
+        }
             
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                
+    except Exception as e:
+        api_stats["failed_requests"] += 1
+        raise HTTPException(
+            status_code=400,
+            detail=f"Error processing image: {str(e)}"
+        )
+
+@app.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(...),
+    _: bool = Depends(verify_api_key)
+) -> Dict:
+    """
+    Predict the classes of several uploaded images in one request.
+    
+    Args:
+        files (List[UploadFile]): The image files to classify
+        
+    Returns:
+        Dict: One prediction per file, in upload order, and the processing time
+    """
+    start_time = time.time()
+    api_stats["total_requests"] += 1
+    api_stats["last_request_time"] = datetime.utcnow().isoformat()
+    
+    if len(files) > MAX_BATCH_FILES:
+        api_stats["failed_requests"] += 1
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files: {len(files)} uploaded, at most {MAX_BATCH_FILES} allowed"
+        )
+    
+    try:
+        # Decode and run the uploads MAX_BATCH_SIZE at a time, so input tensors and
+        # activations stay bounded like the micro-batcher's; each chunk preprocesses
+        # in parallel off the event loop and shares one forward pass
+        loop = asyncio.get_running_loop()
+        chunk_size = max(1, MAX_BATCH_SIZE)
+        predictions = []
+        for start in range(0, len(files), chunk_size):
+            contents = [await file.read() for file in files[start:start + chunk_size]]
+            inputs = await asyncio.gather(*(
+                loop.run_in_executor(EXECUTOR, model.preprocessor.preprocess_bytes, data)
+                for data in contents
+            ))
+            predictions.extend(await loop.run_in_executor(EXECUTOR, model.predict_inputs, inputs))
+        
+        # Update stats
+        response_time = time.time() - start_time
+        api_stats["successful_requests"] += 1
+        api_stats["total_response_time"] += response_time
+        
+        return {
+            "predictions": [
+                {
+                    "class_id": int(class_id),
+                    "confidence": float(confidence),
+                    "filename": file.filename
+                }
+                for file, (class_id, confidence) in zip(files, predictions)
+            ],
+            "processing_time": response_time
+        }
+    
     except Exception as e:
         api_stats["failed_requests"] += 1
         raise HTTPException(
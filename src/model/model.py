@@ -1,46 +1,163 @@
+import functools
+import io
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Union
+import cv2
 import numpy as np
 import onnxruntime as ort
-from PIL import Image
-import torch
-import torchvision.transforms as transforms
-import scipy.special
+from PIL import Image, UnidentifiedImageError
+
+# cv2.imdecode flags that decode at 1/N scale (libjpeg DCT scaling for JPEGs)
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+# Execution providers in order of preference, with their provider options; CPU is the fallback.
+# TensorRT is left out since it builds engines on first start, stalling cold boots
+PREFERRED_PROVIDERS = (
+    ('CUDAExecutionProvider', {
+        'device_id': 0,
+        'arena_extend_strategy': 'kNextPowerOfTwo',
+        'cudnn_conv_algo_search': 'EXHAUSTIVE',
+    }),
+    ('OpenVINOExecutionProvider', {}),
+    ('CoreMLExecutionProvider', {}),
+    ('CPUExecutionProvider', {}),
+)
 
 class ImagePreprocessor:
     """Handles image preprocessing for model input."""
     
-    def __init__(self, target_size: tuple = (224, 224)):
-        """Initialize preprocessor with target image size."""
+    def __init__(
+        self,
+        target_size: tuple = (224, 224),
+        normalize: bool = True,
+        decode_only: bool = False,
+        reducing_gap: float = 3.0
+    ):
+        """Initialize preprocessor with target image size.
+        
+        Args:
+            target_size: Output (width, height)
+            normalize: Apply ImageNet normalization; disable for models that
+                fold it into their graph and take raw 0-255 pixel values
+            decode_only: Only decode to an RGB uint8 (1, H, W, 3) array, for
+                models that resize and normalize inside their graph
+            reducing_gap: Large images are first reduced by an integer factor,
+                keeping at least this multiple of the target size (as in
+                Pillow's resize(reducing_gap=...))
+        """
         self.target_size = target_size
-        self.mean = np.array([0.485, 0.456, 0.406]).reshape(1, 1, 3)
-        self.std = np.array([0.229, 0.224, 0.225]).reshape(1, 1, 3)
+        self.normalize = normalize
+        self.decode_only = decode_only
+        self.reducing_gap = reducing_gap
+        # float32 and NCHW-shaped, so they broadcast against batches without upcasting
+        self.mean = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(1, 3, 1, 1)
+        self.std = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(1, 3, 1, 1)
+        
+        # (x / 255 - mean) / std as a single per-channel affine on uint8 (C, H, W) pixels
+        self.scale = (1.0 / (255.0 * self.std))[0]
+        self.bias = (-self.mean / self.std)[0]
     
-    def preprocess(self, image_path: str) -> np.ndarray:
+    def preprocess(self, image: Union[str, bytes, Image.Image]) -> np.ndarray:
         """Preprocess an image for model input.
         
         Args:
-            image_path: Path to the input image
+            image: Path to the input image, its encoded bytes, or a PIL image
             
         Returns:
-            Preprocessed image as numpy array with shape (1, 3, H, W)
+            Preprocessed image as numpy array with shape (1, 3, H, W), or the
+            decoded uint8 image with shape (1, H, W, 3) in decode-only mode
         """
-        # Load and convert image to RGB
-        image = Image.open(image_path).convert('RGB')
+        if isinstance(image, (bytes, bytearray)):
+            return self.preprocess_bytes(image)
+        if isinstance(image, Image.Image):
+            factor = self._reduction_factor(*image.size)
+            if factor > 1:
+                image = image.reduce(factor)
+            pixels = np.asarray(image.convert('RGB'))
+            if self.decode_only:
+                return pixels[None]
+            return self._to_batch(self._resize(pixels))
+        with open(image, 'rb') as f:
+            return self.preprocess_bytes(f.read())
+
+    def preprocess_bytes(self, data: bytes) -> np.ndarray:
+        """Preprocess encoded image bytes (e.g. an upload) entirely in memory."""
+        image = self.decode(data)
+        if self.decode_only:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)[None]
         
-        # Resize image
-        image = image.resize(self.target_size, Image.Resampling.BILINEAR)
+        # Resize in OpenCV's native BGR order and flip channels on the small image
+        return self._to_batch(self._resize(image)[:, :, ::-1])
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """Decode encoded image bytes into a BGR uint8 (H, W, 3) array with OpenCV.
         
-        # Convert to numpy array and normalize to [0, 1]
-        image_array = np.array(image, dtype=np.float32) / 255.0
+        Images much larger than the target are decoded at 1/2, 1/4 or 1/8 scale,
+        so megapixel uploads never materialize at full resolution. Formats OpenCV
+        cannot read (e.g. GIF before OpenCV 4.11) are decoded with PIL instead.
+        """
+        flags = cv2.IMREAD_COLOR
+        try:
+            # Reads only the header; the pixels are decoded by OpenCV below
+            factor = self._reduction_factor(*Image.open(io.BytesIO(data)).size)
+            flags = REDUCED_DECODE_FLAGS.get(factor, cv2.IMREAD_COLOR)
+        except UnidentifiedImageError:
+            pass
         
-        # Normalize with mean and std
-        image_array = (image_array - self.mean) / self.std
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+        if image is None:
+            image = self._decode_with_pil(data)
+        return image
+
+    def _decode_with_pil(self, data: bytes) -> np.ndarray:
+        """Decode image bytes with PIL into a BGR uint8 (H, W, 3) array, like cv2.imdecode."""
+        try:
+            image = Image.open(io.BytesIO(data))
+            factor = self._reduction_factor(*image.size)
+            if factor > 1:
+                image = image.reduce(factor)
+            return np.asarray(image.convert('RGB'))[:, :, ::-1]
+        except (UnidentifiedImageError, OSError) as e:
+            raise ValueError("Could not decode image data") from e
+
+    def _reduction_factor(self, width: int, height: int) -> int:
+        """Largest of 8, 4, 2 leaving the image at least reducing_gap times the target size."""
+        ratio = min(width / self.target_size[0], height / self.target_size[1]) / self.reducing_gap
+        for factor in REDUCED_DECODE_FLAGS:
+            if ratio >= factor:
+                return factor
+        return 1
+
+    def _resize(self, pixels: np.ndarray) -> np.ndarray:
+        """Resize a uint8 (H, W, 3) array to the target size.
         
-        # Transpose to (C, H, W) and add batch dimension
-        image_array = image_array.transpose(2, 0, 1)[None, ...]
+        Shrinking uses area averaging, which antialiases like PIL's bilinear
+        filter; INTER_LINEAR samples only 2x2 pixels and aliases on downscales.
+        """
+        height, width = pixels.shape[:2]
+        shrinking = width >= self.target_size[0] and height >= self.target_size[1]
+        interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+        return cv2.resize(pixels, self.target_size, interpolation=interpolation)
+
+    def _to_batch(self, pixels: np.ndarray) -> np.ndarray:
+        """Lay out RGB uint8 (H, W, 3) pixels as a normalized float32 (1, 3, H, W) batch."""
+        # uint8 (C, H, W) view of the pixels, written once into a contiguous
+        # float32 batch buffer; normalization is one multiply-add, no float temporaries
+        pixels = pixels.transpose(2, 0, 1)
+        image_array = np.empty((1,) + pixels.shape, dtype=np.float32)
+        if self.normalize:
+            np.multiply(pixels, self.scale, out=image_array[0])
+            image_array += self.bias
+        else:
+            np.copyto(image_array[0], pixels)
         
-        return image_array.astype(np.float32)
+        return image_array
 
 class ONNXModel:
     """Handles ONNX model loading and inference."""
@@ -55,33 +172,162 @@ class ONNXModel:
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found at {model_path}")
         
-        # Initialize ONNX Runtime session
-        self.session = ort.InferenceSession(
-            model_path,
-            providers=['CPUExecutionProvider']
+        # Use the accelerators this onnxruntime build and host expose, falling back to CPU
+        available_providers = ort.get_available_providers()
+        providers = [
+            (provider, options) for provider, options in PREFERRED_PROVIDERS
+            if provider in available_providers
+        ]
+        cpu_only = len(providers) == 1
+        
+        # Reuse the optimized graph an earlier start serialized next to the model, so
+        # each worker skips most of ORT's optimizer. It is saved at the EXTENDED level, which
+        # is hardware independent; the CPU-specific layout passes (NCHWc) of ORT_ENABLE_ALL
+        # run at load. Accelerator graphs are partitioned per device, so only CPU-only
+        # graphs are cached, and the name carries the ORT version that optimized it
+        optimized_path = f"{model_path}.ort-{ort.__version__}.opt.onnx"
+        use_cached = (
+            cpu_only
+            and os.path.exists(optimized_path)
+            and os.path.getmtime(optimized_path) >= os.path.getmtime(model_path)
         )
+        if cpu_only and not use_cached and os.access(os.path.dirname(os.path.abspath(model_path)), os.W_OK):
+            save_options = self._session_options(ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED)
+            save_options.optimized_model_filepath = optimized_path
+            try:
+                ort.InferenceSession(model_path, sess_options=save_options, providers=providers)
+                use_cached = True
+            except Exception:
+                pass
         
-        # Initialize preprocessor
-        self.preprocessor = ImagePreprocessor()
+        # Initialize ONNX Runtime session
+        self.session = None
+        if use_cached:
+            try:
+                self.session = ort.InferenceSession(
+                    optimized_path,
+                    sess_options=self._session_options(ort.GraphOptimizationLevel.ORT_ENABLE_ALL),
+                    providers=providers
+                )
+            except Exception:
+                # Truncated or incompatible cache (e.g. another worker still writing it)
+                pass
+        if self.session is None:
+            self.session = ort.InferenceSession(
+                model_path,
+                sess_options=self._session_options(ort.GraphOptimizationLevel.ORT_ENABLE_ALL),
+                providers=providers
+            )
         
         # Get model metadata
         self.input_name = self.session.get_inputs()[0].name
         self.output_name = self.session.get_outputs()[0].name
+        
+        # Initialize preprocessor; models exported with folded normalization take raw
+        # pixels, and models with a uint8 input resize and normalize in-graph
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.preprocessor = ImagePreprocessor(
+            normalize=metadata.get("normalization") != "embedded",
+            decode_only=self.session.get_inputs()[0].type == 'tensor(uint8)'
+        )
+        
+        # In-graph preprocessing takes images at their native size; nothing to preallocate
+        self.io_binding = None
+        if self.preprocessor.decode_only:
+            return
+        
+        # Bind persistent single-image input/output buffers once so predict_array
+        # copies in place instead of allocating ORT tensors on every call. On CUDA the
+        # input lives in device memory, so each update is a single host-to-device copy
+        width, height = self.preprocessor.target_size
+        num_classes = self.session.get_outputs()[0].shape[-1]
+        input_device = 'cuda' if self.session.get_providers()[0] == 'CUDAExecutionProvider' else 'cpu'
+        self.input_ort = ort.OrtValue.ortvalue_from_shape_and_type([1, 3, height, width], np.float32, input_device)
+        self.output_ort = ort.OrtValue.ortvalue_from_shape_and_type([1, num_classes], np.float32, 'cpu')
+        self.io_binding = self.session.io_binding()
+        self.io_binding.bind_ortvalue_input(self.input_name, self.input_ort)
+        self.io_binding.bind_ortvalue_output(self.output_name, self.output_ort)
+        self._io_lock = threading.Lock()
     
-    def predict(self, image_path: str) -> tuple:
+    @staticmethod
+    def _session_options(level: ort.GraphOptimizationLevel) -> ort.SessionOptions:
+        """Session options tuned for CPU throughput, at the given graph optimization level."""
+        # No inter-op pool and arena/pattern-planned memory; intra-op threads stay at
+        # ORT's default of one per physical core unless ORT_INTRA_OP_NUM_THREADS is set
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = level
+        if "ORT_INTRA_OP_NUM_THREADS" in os.environ:
+            sess_options.intra_op_num_threads = int(os.environ["ORT_INTRA_OP_NUM_THREADS"])
+        sess_options.inter_op_num_threads = 1
+        sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        sess_options.enable_cpu_mem_arena = True
+        sess_options.enable_mem_pattern = True
+        return sess_options
+
+    def predict(self, image: Union[str, bytes, Image.Image]) -> tuple:
         """Run inference on a single image and return class ID and confidence."""
-        input_data = self.preprocessor.preprocess(image_path)
-        input_name = self.session.get_inputs()[0].name
-        outputs = self.session.run(
-            [self.session.get_outputs()[0].name],
-            {input_name: input_data}
-        )
-        logits = outputs[0][0]
-        probs = scipy.special.softmax(logits)
-        class_id = int(np.argmax(probs))
-        confidence = float(np.max(probs))
+        return self.predict_array(self.preprocessor.preprocess(image))
+
+    def predict_bytes(self, data: bytes) -> tuple:
+        """Run inference on encoded image bytes without writing them to disk."""
+        return self.predict_array(self.preprocessor.preprocess_bytes(data))
+
+    def predict_array(self, input_data: np.ndarray) -> tuple:
+        """Run inference on one preprocessed (1, 3, H, W) array, skipping preprocessing."""
+        # update_inplace copies raw bytes, so only same-shaped C-contiguous float32 can be bound
+        if (
+            self.io_binding is None
+            or input_data.shape != tuple(self.input_ort.shape())
+            or input_data.dtype != np.float32
+            or not input_data.flags.c_contiguous
+        ):
+            logits = self.session.run([self.output_name], {self.input_name: input_data})[0][0]
+            return self._top1(logits)
+        
+        # The bound buffers are shared, and the output view is overwritten by the next run
+        with self._io_lock:
+            self.input_ort.update_inplace(input_data)
+            self.session.run_with_iobinding(self.io_binding)
+            return self._top1(self.output_ort.numpy()[0])
+
+    @staticmethod
+    def _top1(logits: np.ndarray) -> Tuple[int, float]:
+        """Return the top class and its softmax probability for one row of logits."""
+        # Softmax is monotonic, so argmax the raw logits; the winner is also the
+        # max used for a stable softmax, leaving 1 / sum(exp(logits - max))
+        class_id = int(np.argmax(logits))
+        confidence = float(1.0 / np.exp(logits - logits[class_id]).sum())
         return class_id, confidence
 
     def predict_batch(self, image_paths: list) -> list:
-        """Run inference on a batch of images."""
-        return [self.predict(img_path) for img_path in image_paths] 
\ No newline at end of file
+        """Run inference on a batch of images with a single session call."""
+        if not image_paths:
+            return []
+        
+        # Preprocess in parallel; OpenCV decode/resize and NumPy release the GIL
+        with ThreadPoolExecutor(max_workers=min(len(image_paths), os.cpu_count() or 1)) as executor:
+            inputs = list(executor.map(self.preprocessor.preprocess, image_paths))
+        return self.predict_inputs(inputs)
+
+    def predict_inputs(self, inputs: List[np.ndarray]) -> List[Tuple[int, float]]:
+        """Run inference on preprocessed (1, ...) inputs, in one session call when they stack."""
+        if not inputs:
+            return []
+        
+        # Decode-only inputs keep their native sizes and can't always be stacked
+        if len({input_data.shape for input_data in inputs}) > 1:
+            return [self.predict_array(input_data) for input_data in inputs]
+        return self.predict_preprocessed(np.concatenate(inputs, axis=0))
+
+    def predict_preprocessed(self, batch: np.ndarray) -> List[Tuple[int, float]]:
+        """Run one forward pass over an already preprocessed (N, 3, H, W) batch."""
+        logits = self.session.run([self.output_name], {self.input_name: batch})[0]
+        class_ids = np.argmax(logits, axis=1)
+        max_logits = logits[np.arange(len(class_ids)), class_ids][:, None]
+        confidences = 1.0 / np.exp(logits - max_logits).sum(axis=1)
+        return [(int(class_id), float(confidence)) for class_id, confidence in zip(class_ids, confidences)] 
+
+@functools.lru_cache(maxsize=4)
+def get_model(model_path: str) -> ONNXModel:
+    """Return a shared ONNXModel per path, so the session and its optimized graph build once."""
+    return ONNXModel(model_path)
@@ -92,6 +92,113 @@ def test_predict_endpoint_with_auth(client, test_image, api_key):
     assert isinstance(data["confidence"], float)
     assert 0 <= data["confidence"] <= 1
 
+@pytest.mark.parametrize("authorization, detail", [
+    ("Basic test_api_key", "Invalid authentication scheme"),
+    ("Bearer wrong_key", "Invalid API key"),
+    ("Bearer", "Invalid authentication scheme"),
+    ("Bearer ", "Invalid API key"),
+])
+def test_predict_endpoint_rejects_bad_auth(client, test_image, authorization, detail):
+    """Test that malformed or wrong authorization headers are rejected."""
+    with open(test_image, "rb") as f:
+        response = client.post(
+            "/predict",
+            headers={"Authorization": authorization},
+            files={"file": ("test_image.jpeg", f, "image/jpeg")}
+        )
+    
+    assert response.status_code == 401
+    assert response.json()["detail"] == detail
+
+@pytest.mark.parametrize("authorization", [
+    "bearer test_api_key",
+    "BEARER test_api_key",
+    "Bearer  test_api_key",
+])
+def test_predict_endpoint_accepts_auth_variants(client, test_image, authorization):
+    """Test that the scheme is case-insensitive and extra spaces before the key are ignored."""
+    with open(test_image, "rb") as f:
+        response = client.post(
+            "/predict",
+            headers={"Authorization": authorization},
+            files={"file": ("test_image.jpeg", f, "image/jpeg")}
+        )
+    
+    assert response.status_code == 200
+
+def test_predict_batch_endpoint(client, test_image, api_key):
+    """Test that the batch endpoint matches single predictions, in upload order."""
+    os.environ["CEREBRIUM_API_KEY"] = api_key
+    image_paths = [test_image, "n01667114_mud_turtle.JPEG", test_image]
+    
+    files = [("files", (os.path.basename(path), open(path, "rb"), "image/jpeg")) for path in image_paths]
+    try:
+        response = client.post(
+            "/predict/batch",
+            headers={"Authorization": f"Bearer {api_key}"},
+            files=files
+        )
+    finally:
+        for _, (_, f, _) in files:
+            f.close()
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert "processing_time" in data
+    assert [p["filename"] for p in data["predictions"]] == [os.path.basename(path) for path in image_paths]
+    
+    for path, prediction in zip(image_paths, data["predictions"]):
+        with open(path, "rb") as f:
+            single = client.post(
+                "/predict",
+                headers={"Authorization": f"Bearer {api_key}"},
+                files={"file": (os.path.basename(path), f, "image/jpeg")}
+            ).json()
+        assert prediction["class_id"] == single["class_id"]
+        assert prediction["confidence"] == pytest.approx(single["confidence"], abs=1e-5)
+
+def test_predict_batch_endpoint_runs_in_chunks(client, test_image, api_key, monkeypatch):
+    """Test that large batch uploads run MAX_BATCH_SIZE images per forward pass."""
+    import src.app
+    os.environ["CEREBRIUM_API_KEY"] = api_key
+    monkeypatch.setattr(src.app, "MAX_BATCH_SIZE", 2)
+    
+    chunk_sizes = []
+    predict_inputs = src.app.model.predict_inputs
+    def record_chunk(inputs):
+        chunk_sizes.append(len(inputs))
+        return predict_inputs(inputs)
+    monkeypatch.setattr(src.app.model, "predict_inputs", record_chunk)
+    
+    with open(test_image, "rb") as f:
+        data = f.read()
+    response = client.post(
+        "/predict/batch",
+        headers={"Authorization": f"Bearer {api_key}"},
+        files=[("files", (f"image_{i}.jpeg", data, "image/jpeg")) for i in range(5)]
+    )
+    
+    assert response.status_code == 200
+    assert len(response.json()["predictions"]) == 5
+    assert chunk_sizes == [2, 2, 1]
+
+def test_predict_batch_endpoint_rejects_too_many_files(client, test_image, api_key, monkeypatch):
+    """Test that uploads beyond MAX_BATCH_FILES are rejected before decoding."""
+    import src.app
+    os.environ["CEREBRIUM_API_KEY"] = api_key
+    monkeypatch.setattr(src.app, "MAX_BATCH_FILES", 2)
+    
+    with open(test_image, "rb") as f:
+        data = f.read()
+    response = client.post(
+        "/predict/batch",
+        headers={"Authorization": f"Bearer {api_key}"},
+        files=[("files", (f"image_{i}.jpeg", data, "image/jpeg")) for i in range(3)]
+    )
+    
+    assert response.status_code == 413
+    assert "Too many files" in response.json()["detail"]
+
 def test_predict_endpoint_invalid_image(client, api_key):
     """Test the predict endpoint with an invalid image."""
     os.environ["CEREBRIUM_API_KEY"] = api_key
@@ -0,0 +1,94 @@
+import asyncio
+import numpy as np
+from pathlib import Path
+import sys
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from src.utils.batching import MicroBatcher
+
+def make_predict_fn(batch_sizes):
+    """Fake model returning (row value, batch size) and recording each batch size."""
+    def predict_fn(batch):
+        batch_sizes.append(len(batch))
+        return [(int(row[0]), float(len(batch))) for row in batch]
+    return predict_fn
+
+def test_concurrent_requests_are_coalesced():
+    """Test that concurrent submissions share one batched call."""
+    batch_sizes = []
+    batcher = MicroBatcher(make_predict_fn(batch_sizes), max_batch_size=8, max_latency_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(np.array([[i]])) for i in range(4)))
+
+    results = asyncio.run(run())
+    assert [class_id for class_id, _ in results] == [0, 1, 2, 3]
+    assert batch_sizes == [4]
+
+def test_batches_are_capped_at_max_batch_size():
+    """Test that bursts beyond max_batch_size are split across calls."""
+    batch_sizes = []
+    batcher = MicroBatcher(make_predict_fn(batch_sizes), max_batch_size=2, max_latency_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(np.array([[i]])) for i in range(5)))
+
+    results = asyncio.run(run())
+    assert [class_id for class_id, _ in results] == [0, 1, 2, 3, 4]
+    assert batch_sizes == [2, 2, 1]
+
+def test_mismatched_shapes_run_in_separate_batches():
+    """Test that inputs of different shapes are not stacked together."""
+    batch_sizes = []
+    batcher = MicroBatcher(make_predict_fn(batch_sizes), max_batch_size=8, max_latency_ms=50)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.submit(np.array([[0]])),
+            batcher.submit(np.array([[1, 1]])),
+            batcher.submit(np.array([[2]]))
+        )
+
+    results = asyncio.run(run())
+    assert [class_id for class_id, _ in results] == [0, 1, 2]
+    assert sorted(batch_sizes) == [1, 2]
+
+def test_errors_propagate_to_every_caller():
+    """Test that a failing batch raises in each waiting request."""
+    def predict_fn(batch):
+        raise ValueError("bad batch")
+    batcher = MicroBatcher(predict_fn, max_batch_size=4, max_latency_ms=10)
+
+    async def run():
+        return await asyncio.gather(
+            *(batcher.submit(np.array([[i]])) for i in range(2)),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_stacking_errors_propagate_and_batcher_keeps_running():
+    """Test that inputs which can't be stacked fail their callers without stopping the batcher."""
+    batcher = MicroBatcher(make_predict_fn([]), max_batch_size=4, max_latency_ms=10)
+
+    async def run():
+        failed = await asyncio.gather(
+            *(batcher.submit(np.array(i)) for i in range(2)),
+            return_exceptions=True
+        )
+        return failed, await batcher.submit(np.array([[5]]))
+
+    failed, (class_id, _) = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert all(isinstance(result, ValueError) for result in failed)
+    assert class_id == 5
+
+def test_batcher_survives_event_loop_change():
+    """Test that the batcher rebinds when reused from a new event loop."""
+    batcher = MicroBatcher(make_predict_fn([]), max_batch_size=4, max_latency_ms=1)
+
+    for i in range(2):
+        class_id, _ = asyncio.run(batcher.submit(np.array([[i]])))
+        assert class_id == i
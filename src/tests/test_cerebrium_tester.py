@@ -0,0 +1,131 @@
+import os
+import re
+import pytest
+import orjson
+import requests
+import numpy as np
+from pathlib import Path
+import sys
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import src.tests.test_server as test_server
+from src.tests.test_server import CerebriumTester
+
+# Test data paths and the class IDs the fake server reports for them
+TEST_IMAGES = [
+    ('n01440764_tench.jpeg', 0),
+    ('n01667114_mud_turtle.JPEG', 35)
+]
+
+class FakeAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter that answers batch uploads locally and records each request."""
+
+    def __init__(self, max_predictions=None):
+        super().__init__()
+        self.max_predictions = max_predictions
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        classes = dict(TEST_IMAGES)
+        filenames = re.findall(rb'name="files"; filename="([^"]+)"', request.body)
+        predictions = [
+            {"class_id": classes[name.decode()], "confidence": 0.9, "filename": name.decode()}
+            for name in filenames
+        ][:self.max_predictions]
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = orjson.dumps({"predictions": predictions, "processing_time": 0.01})
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def adapter():
+    """Fixture to provide a fake transport for the tester's session."""
+    return FakeAdapter()
+
+@pytest.fixture
+def tester(adapter):
+    """Fixture to create a tester whose requests go to the fake transport."""
+    tester = CerebriumTester("test_api_key", "http://server/predict")
+    tester.session.mount("http://", adapter)
+    yield tester
+    tester.close()
+
+def test_predict_batch_sends_one_request(tester, adapter):
+    """Test that predict_batch uploads every image in one request to the batch endpoint."""
+    predictions, response_time = tester.predict_batch([path for path, _ in TEST_IMAGES])
+
+    assert len(adapter.requests) == 1
+    assert adapter.requests[0].url == "http://server/predict/batch"
+    assert [p["filename"] for p in predictions] == [path for path, _ in TEST_IMAGES]
+    assert response_time >= 0
+    assert tester.metrics["total_requests"] == 1
+
+def test_batch_preset_tests(tester, adapter):
+    """Test that batch mode produces one passing result per image, in order."""
+    results = tester.run_preset_tests(TEST_IMAGES, batch=True)
+
+    assert len(adapter.requests) == 1
+    assert [r.image_path for r in results] == [path for path, _ in TEST_IMAGES]
+    assert all(r.success for r in results)
+
+def test_batch_preset_tests_fail_on_missing_predictions(tester, adapter):
+    """Test that a short predictions list fails every test instead of hanging."""
+    adapter.max_predictions = 1
+    results = tester.run_preset_tests(TEST_IMAGES, batch=True)
+
+    assert len(results) == len(TEST_IMAGES)
+    assert not any(r.success for r in results)
+    assert all("Expected 2 predictions, got 1" in r.error for r in results)
+
+def test_batch_flag_uses_batch_endpoint(adapter, tmp_path, monkeypatch):
+    """Test that the --batch CLI flag sends the preset tests as one batch request."""
+    monkeypatch.setattr(test_server, "HTTPAdapter", lambda **kwargs: adapter)
+    monkeypatch.setattr(sys, "argv", [
+        "test_server.py",
+        "--api_key", "test_api_key",
+        "--api_url", "http://server/predict",
+        "--batch",
+        "--output_dir", str(tmp_path)
+    ])
+
+    test_server.main()
+
+    assert [request.url for request in adapter.requests] == ["http://server/predict/batch"]
+    assert any(name.startswith("test_report_") for name in os.listdir(tmp_path))
+
+def test_response_time_stats_empty(tester):
+    """Test that stats are all zero before any request is recorded."""
+    assert tester.response_time_stats() == {
+        "avg": 0.0, "min": 0.0, "max": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0
+    }
+
+def test_response_time_stats_match_numpy(tester):
+    """Test that the summary statistics match NumPy over the returned response times."""
+    times = [tester.predict_batch([TEST_IMAGES[0][0]])[1] for _ in range(20)]
+    stats = tester.response_time_stats()
+
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    assert stats["p50"] == pytest.approx(p50)
+    assert stats["p95"] == pytest.approx(p95)
+    assert stats["p99"] == pytest.approx(p99)
+    assert stats["avg"] == pytest.approx(np.mean(times))
+    assert stats["min"] == min(times) and stats["max"] == max(times)
+
+def test_response_times_grow_past_initial_buffer(tester):
+    """Test that recording more than the preallocated 1024 response times keeps them all."""
+    size = tester._response_times.size
+    times = [tester.predict_batch([TEST_IMAGES[0][0]])[1] for _ in range(size + 1)]
+
+    assert tester._num_response_times == size + 1
+    assert tester._response_times.size > size
+    np.testing.assert_array_equal(tester._response_times[:size + 1], times)
+    assert tester.response_time_stats()["p99"] == pytest.approx(np.percentile(times, 99))
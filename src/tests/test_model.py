@@ -7,8 +7,9 @@ import sys
 # Add the parent directory to the Python path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
-from src.model.model import ONNXModel, ImagePreprocessor
-from src.utils.convert_to_onnx import convert_to_onnx
+from src.model.model import ONNXModel, ImagePreprocessor, get_model
+from src.utils.convert_to_onnx import convert_to_onnx, convert_to_fp16, quantize_to_int8
+import convert_to_onnx as preprocessing_export
 
 # Test data paths
 TEST_IMAGES = {
@@ -16,12 +17,12 @@ TEST_IMAGES = {
     'mud_turtle': 'n01667114_mud_turtle.JPEG'
 }
 
-@pytest.fixture
-def model_path(tmp_path):
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
     """Fixture to create a temporary ONNX model for testing."""
     # Path to PyTorch weights (you'll need to download this)
     pytorch_weights = "pytorch_model_weights.pth"
-    onnx_path = tmp_path / "test_model.onnx"
+    onnx_path = tmp_path_factory.mktemp("model") / "test_model.onnx"
     
     # Convert model to ONNX
     convert_to_onnx(
@@ -35,7 +36,7 @@ def model_path(tmp_path):
 @pytest.fixture
 def model(model_path):
     """Fixture to create a model instance for testing."""
-    return ONNXModel(model_path)
+    return get_model(model_path)
 
 @pytest.fixture
 def preprocessor():
@@ -56,6 +57,69 @@ def test_preprocessor_normalization(preprocessor):
         # Check that values are roughly normalized
         assert np.all(output >= -3) and np.all(output <= 3)
 
+def test_preprocessor_accepts_bytes(preprocessor):
+    """Test that in-memory image bytes preprocess identically to a file path."""
+    for image_name in TEST_IMAGES.values():
+        with open(image_name, 'rb') as f:
+            from_bytes = preprocessor.preprocess(f.read())
+        np.testing.assert_allclose(from_bytes, preprocessor.preprocess(image_name))
+
+def test_preprocessor_falls_back_to_pil(preprocessor, monkeypatch):
+    """Test that formats OpenCV cannot decode (e.g. GIF on older builds) go through PIL."""
+    import io
+    import cv2
+    from PIL import Image
+    
+    buffer = io.BytesIO()
+    Image.open(TEST_IMAGES['tench']).save(buffer, format='GIF')
+    monkeypatch.setattr(cv2, "imdecode", lambda *args: None)
+    
+    image = preprocessor.decode(buffer.getvalue())
+    assert image.dtype == np.uint8 and image.shape[2] == 3
+    assert preprocessor.preprocess(buffer.getvalue()).shape == (1, 3, 224, 224)
+    with pytest.raises(ValueError):
+        preprocessor.decode(b"not an image")
+
+def pil_reference(image):
+    """Baseline preprocessing: PIL bilinear resize followed by ImageNet normalization."""
+    from PIL import Image
+    
+    resized = image.convert('RGB').resize((224, 224), Image.Resampling.BILINEAR)
+    return ImagePreprocessor()._to_batch(np.asarray(resized))
+
+@pytest.mark.parametrize("name", TEST_IMAGES)
+@pytest.mark.parametrize("size", [None, (1000, 750), (1600, 1200)])
+def test_preprocessor_matches_pil_resize(preprocessor, name, size):
+    """Test that decoding and resizing stay close to the PIL bilinear baseline."""
+    import io
+    from PIL import Image
+    
+    image = Image.open(TEST_IMAGES[name]).convert('RGB')
+    if size is not None:
+        image = image.resize(size)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=95)
+    
+    reference = pil_reference(image)
+    assert np.abs(preprocessor.preprocess(buffer.getvalue()) - reference).mean() < 0.07
+    assert np.abs(preprocessor.preprocess(image) - reference).mean() < 0.07
+
+def test_preprocessor_reduces_large_images(preprocessor):
+    """Test that large uploads decoded at reduced scale stay close to the PIL baseline."""
+    import io
+    from PIL import Image
+    
+    large = Image.open(TEST_IMAGES['mud_turtle']).convert('RGB').resize((4000, 3000))
+    buffer = io.BytesIO()
+    large.save(buffer, format='JPEG', quality=95)
+    
+    assert preprocessor._reduction_factor(*large.size) == 4
+    reference = pil_reference(large)
+    reduced = preprocessor.preprocess(buffer.getvalue())
+    assert reduced.shape == (1, 3, 224, 224)
+    assert np.abs(reduced - reference).mean() < 0.07
+    assert np.abs(preprocessor.preprocess(large) - reference).mean() < 0.07
+
 def test_model_initialization(model_path):
     """Test model initialization."""
     # Test successful initialization
@@ -66,6 +130,112 @@ def test_model_initialization(model_path):
     with pytest.raises(FileNotFoundError):
         ONNXModel("non_existent_model.onnx")
 
+def test_converted_model_is_self_contained(model_path):
+    """Test that conversion leaves one model file with inline weights and no stale side file."""
+    import onnx
+    
+    model = onnx.load(model_path, load_external_data=False)
+    assert all(tensor.data_location != onnx.TensorProto.EXTERNAL for tensor in model.graph.initializer)
+    assert not os.path.exists(model_path + ".data")
+
+def test_get_model_shares_session(model_path):
+    """Test that get_model reuses one model (and session) per path."""
+    assert get_model(model_path) is get_model(model_path)
+    assert get_model(model_path).session is get_model(model_path).session
+
+def test_optimized_graph_is_reused(model_path, tmp_path):
+    """Test that a portable serialized optimized graph is loaded on the next start."""
+    import shutil
+    import onnx
+    import onnxruntime as ort
+    
+    cached_model_path = str(tmp_path / "model.onnx")
+    shutil.copy(model_path, cached_model_path)
+    optimized_path = f"{cached_model_path}.ort-{ort.__version__}.opt.onnx"
+    
+    first = ONNXModel(cached_model_path)
+    assert os.path.exists(optimized_path)
+    # CPU-specific NCHWc layout ops are applied at load, never serialized
+    assert all(node.domain != 'com.microsoft.nchwc' for node in onnx.load(optimized_path).graph.node)
+    
+    second = ONNXModel(cached_model_path)
+    assert second.preprocessor.normalize == first.preprocessor.normalize
+    assert second.predict(TEST_IMAGES['tench']) == pytest.approx(first.predict(TEST_IMAGES['tench']))
+    
+    # A corrupt cache falls back to optimizing the original model
+    with open(optimized_path, 'wb') as f:
+        f.write(b"truncated")
+    assert ONNXModel(cached_model_path).predict(TEST_IMAGES['tench'])[0] == first.predict(TEST_IMAGES['tench'])[0]
+
+def test_folded_normalization_matches_preprocessor(model_path, tmp_path):
+    """Test that folding normalization into the graph preserves the logits."""
+    unfolded_path = tmp_path / "unfolded_model.onnx"
+    convert_to_onnx(
+        model_path="pytorch_model_weights.pth",
+        output_path=str(unfolded_path),
+        opset_version=12,
+        fold_input_normalization=False
+    )
+    folded, unfolded = get_model(model_path), ONNXModel(str(unfolded_path))
+    assert not folded.preprocessor.normalize
+    assert unfolded.preprocessor.normalize
+    
+    for image_name in TEST_IMAGES.values():
+        folded_logits = folded.session.run(None, {folded.input_name: folded.preprocessor.preprocess(image_name)})[0]
+        unfolded_logits = unfolded.session.run(None, {unfolded.input_name: unfolded.preprocessor.preprocess(image_name)})[0]
+        np.testing.assert_allclose(folded_logits, unfolded_logits, rtol=1e-3, atol=1e-3)
+
+def test_int8_model_prediction(model, model_path, tmp_path):
+    """Test that the INT8-quantized model agrees with the FP32 model."""
+    int8_path = tmp_path / "test_model.int8.onnx"
+    quantize_to_int8(
+        model_path,
+        str(int8_path),
+        calibration_images=list(TEST_IMAGES.values()),
+        normalize=False
+    )
+    int8_model = ONNXModel(str(int8_path))
+    
+    for image_name in TEST_IMAGES.values():
+        class_id, confidence = int8_model.predict(image_name)
+        assert class_id == model.predict(image_name)[0]
+        assert 0 <= confidence <= 1
+
+def test_fp16_model_prediction(model, model_path, tmp_path):
+    """Test that the FP16 model keeps FP32 I/O and agrees with the FP32 model."""
+    fp16_path = tmp_path / "test_model.fp16.onnx"
+    convert_to_fp16(model_path, str(fp16_path))
+    fp16_model = ONNXModel(str(fp16_path))
+    
+    assert fp16_model.session.get_inputs()[0].type == 'tensor(float)'
+    for image_name in TEST_IMAGES.values():
+        class_id, confidence = fp16_model.predict(image_name)
+        assert class_id == model.predict(image_name)[0]
+        assert confidence == pytest.approx(model.predict(image_name)[1], abs=1e-2)
+
+def test_in_graph_preprocessing_model(model, tmp_path):
+    """Test that a model taking raw uint8 images agrees with host-side preprocessing."""
+    raw_path = tmp_path / "test_model_raw.onnx"
+    preprocessing_export.convert_to_onnx("pytorch_model_weights.pth", str(raw_path), include_preprocessing=True)
+    raw_model = ONNXModel(str(raw_path))
+    assert raw_model.preprocessor.decode_only
+    
+    # The in-graph resize antialiases downscales, matching host-side preprocessing
+    import onnx
+    resizes = [node for node in onnx.load(str(raw_path)).graph.node if node.op_type == 'Resize']
+    assert resizes and all(
+        onnx.helper.get_node_attr_value(node, 'antialias') == 1 for node in resizes
+    )
+    
+    for image_name in TEST_IMAGES.values():
+        raw_input = raw_model.preprocessor.preprocess(image_name)
+        assert raw_input.dtype == np.uint8 and raw_input.ndim == 4 and raw_input.shape[-1] == 3
+        assert raw_model.predict(image_name)[0] == model.predict(image_name)[0]
+    
+    # Differently sized images still batch
+    predictions = raw_model.predict_batch(list(TEST_IMAGES.values()))
+    assert len(predictions) == len(TEST_IMAGES)
+
 def test_model_prediction(model):
     """Test model prediction on test images."""
     # Test prediction on tench image
@@ -78,6 +248,12 @@ def test_model_prediction(model):
     assert class_id == 35  # mud turtle class ID
     assert 0 <= confidence <= 1
 
+def test_model_predict_bytes(model):
+    """Test that predicting from upload bytes matches predicting from a path."""
+    for image_name in TEST_IMAGES.values():
+        with open(image_name, 'rb') as f:
+            assert model.predict_bytes(f.read()) == model.predict(image_name)
+
 def test_model_batch_prediction(model):
     """Test batch prediction functionality."""
     image_paths = list(TEST_IMAGES.values())
@@ -87,6 +263,28 @@ def test_model_batch_prediction(model):
     for class_id, confidence in predictions:
         assert isinstance(class_id, int)
         assert 0 <= confidence <= 1
+    
+    # Batched inference must match one-at-a-time inference
+    for image_path, (class_id, confidence) in zip(image_paths, predictions):
+        single_class_id, single_confidence = model.predict(image_path)
+        assert class_id == single_class_id
+        assert confidence == pytest.approx(single_confidence, abs=1e-5)
+
+def test_predict_array_ignores_layout(model, preprocessor):
+    """Test that float64 or non-contiguous inputs are not misread by the bound buffer."""
+    if model.io_binding is None:
+        pytest.skip("IOBinding is only used on CPU")
+    input_data = preprocessor.preprocess(TEST_IMAGES['tench'])
+    class_id, confidence = model.predict_array(input_data)
+    
+    fortran = np.asfortranarray(input_data)
+    assert not fortran.flags.c_contiguous
+    assert model.predict_array(fortran)[0] == class_id
+    assert model.predict_array(fortran)[1] == pytest.approx(confidence, rel=1e-4)
+    
+    # Falls back to session.run, which rejects float64 instead of reading its raw bytes
+    with pytest.raises(Exception, match="Unexpected input data type"):
+        model.predict_array(input_data.astype(np.float64))
 
 def test_model_invalid_input(model):
     """Test model behavior with invalid inputs."""
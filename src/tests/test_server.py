@@ -1,17 +1,40 @@
+import functools
 import os
 import sys
 import argparse
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import orjson
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 import time
 from datetime import datetime
 import numpy as np
-from PIL import Image
-import matplotlib.pyplot as plt
 from dataclasses import dataclass
 
+# Per-test console output, written with a single print per test
+RESULT_TEMPLATE = (
+    "\nTesting image: {image_path}\n"
+    "Expected class: {expected_class}\n"
+    "Predicted class: {predicted_class}\n"
+    "Confidence: {confidence:.4f}\n"
+    "Response time: {response_time:.3f}s\n"
+    "Test {status}"
+)
+ERROR_TEMPLATE = (
+    "\nTesting image: {image_path}\n"
+    "Expected class: {expected_class}\n"
+    "Error testing {image_path}: {error}"
+)
+
+@functools.lru_cache(maxsize=128)
+def _basename(image_path: str) -> str:
+    """Upload filename for an image path, computed once per path"""
+    return os.path.basename(image_path)
+
 @dataclass
 class TestResult:
     """Class to store test results"""
@@ -36,20 +59,46 @@ class CerebriumTester:
         """
         self.api_key = api_key
         self.api_url = api_url
+        self.batch_url = f"{api_url.rstrip('/')}/batch"
+        # No Content-Type here: uploads are multipart and requests sets the boundary
         self.headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
+            'Authorization': f'Bearer {api_key}'
         }
+        
+        # One pooled keep-alive session for every request to the deployment
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
         self.test_results: List[TestResult] = []
         self.metrics = {
             "total_requests": 0,
             "successful_requests": 0,
             "failed_requests": 0,
-            "total_response_time": 0,
-            "min_response_time": float('inf'),
-            "max_response_time": 0,
             "errors": {}
         }
+        # Response times of every completed request, grown by doubling
+        self._response_times = np.empty(1024, dtype=np.float64)
+        self._num_response_times = 0
+        # Plots render in the background so the JSON report returns right away
+        self._plot_pool: Optional[ThreadPoolExecutor] = None
+        # predict runs from several threads in run_preset_tests
+        self._metrics_lock = threading.Lock()
+    
+    def close(self):
+        """Close the pooled HTTP session and wait for pending plots"""
+        self.session.close()
+        if self._plot_pool is not None:
+            self._plot_pool.shutdown(wait=True)
+            self._plot_pool = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def predict(self, image_path: str) -> Tuple[Dict, float]:
         """
@@ -61,94 +110,177 @@ class CerebriumTester:
         Returns:
             Tuple[Dict, float]: Prediction response and response time
         """
-        try:
-            # Read and encode image
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
+        return self._post(self.api_url, 'file', [image_path])
+    
+    def predict_batch(self, image_paths: List[str]) -> Tuple[List[Dict], float]:
+        """
+        Make one batched prediction request for several images
+        
+        Args:
+            image_paths (List[str]): Paths to the input images
             
-            # Make request
-            start_time = time.time()
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                files={'file': (os.path.basename(image_path), image_data)}
-            )
-            response_time = time.time() - start_time
+        Returns:
+            Tuple[List[Dict], float]: One prediction per image, in order, and the response time
+        """
+        response, response_time = self._post(self.batch_url, 'files', image_paths)
+        return response["predictions"], response_time
+    
+    def _post(self, url: str, field: str, image_paths: List[str]) -> Tuple[Dict, float]:
+        """Upload images as multipart form field(s) and record the request in the metrics"""
+        try:
+            # Hand the open files to requests, which reads them straight into the
+            # multipart body (boundary Content-Type is set by requests itself)
+            with ExitStack() as stack:
+                files = [
+                    (field, (_basename(image_path), stack.enter_context(open(image_path, 'rb')), 'application/octet-stream'))
+                    for image_path in image_paths
+                ]
+                
+                # Make request
+                start_time = time.time()
+                response = self.session.post(url, files=files)
+                response_time = time.time() - start_time
             
             # Update metrics
-            self.metrics["total_requests"] += 1
-            self.metrics["total_response_time"] += response_time
-            self.metrics["min_response_time"] = min(self.metrics["min_response_time"], response_time)
-            self.metrics["max_response_time"] = max(self.metrics["max_response_time"], response_time)
+            with self._metrics_lock:
+                self.metrics["total_requests"] += 1
+                if self._num_response_times == self._response_times.size:
+                    self._response_times = np.resize(self._response_times, 2 * self._response_times.size)
+                self._response_times[self._num_response_times] = response_time
+                self._num_response_times += 1
             
             if response.status_code == 200:
-                self.metrics["successful_requests"] += 1
-                return response.json(), response_time
+                with self._metrics_lock:
+                    self.metrics["successful_requests"] += 1
+                return orjson.loads(response.content), response_time
             else:
-                self.metrics["failed_requests"] += 1
                 error_msg = f"Request failed with status {response.status_code}: {response.text}"
-                self.metrics["errors"][error_msg] = self.metrics["errors"].get(error_msg, 0) + 1
+                with self._metrics_lock:
+                    self.metrics["failed_requests"] += 1
+                    self.metrics["errors"][error_msg] = self.metrics["errors"].get(error_msg, 0) + 1
                 raise Exception(error_msg)
                 
         except Exception as e:
-            self.metrics["failed_requests"] += 1
             error_msg = str(e)
-            self.metrics["errors"][error_msg] = self.metrics["errors"].get(error_msg, 0) + 1
+            with self._metrics_lock:
+                self.metrics["failed_requests"] += 1
+                self.metrics["errors"][error_msg] = self.metrics["errors"].get(error_msg, 0) + 1
             raise
     
-    def run_preset_tests(self, test_images: List[Tuple[str, int]]) -> List[TestResult]:
+    def run_preset_tests(
+        self,
+        test_images: List[Tuple[str, int]],
+        max_workers: int = 8,
+        batch: bool = False
+    ) -> List[TestResult]:
         """
         Run a set of preset tests with known expected classes
         
         Args:
             test_images (List[Tuple[str, int]]): List of (image_path, expected_class) tuples
+            max_workers (int): Maximum number of requests in flight at once
+            batch (bool): Send all images in one request to the batch endpoint
             
         Returns:
             List[TestResult]: List of test results
         """
         print("\nRunning preset tests...")
-        for image_path, expected_class in test_images:
+        if not test_images:
+            return self.test_results
+        if batch:
+            return self._run_batch_tests(test_images)
+        
+        # Requests are independent, so keep several in flight on the pooled session;
+        # results are reported as they complete but stored in input order
+        results: List[Optional[TestResult]] = [None] * len(test_images)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(test_images))) as executor:
+            futures = {
+                executor.submit(self.predict, image_path): index
+                for index, (image_path, _) in enumerate(test_images)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                image_path, expected_class = test_images[index]
+                try:
+                    response, response_time = future.result()
+                    results[index] = self._collect_result(image_path, expected_class, response, response_time)
+                except Exception as e:
+                    results[index] = self._error_result(image_path, expected_class, e)
+        
+        self.test_results.extend(results)
+        return self.test_results
+    
+    def _run_batch_tests(self, test_images: List[Tuple[str, int]]) -> List[TestResult]:
+        """Run all preset tests in one batched request; a failed request fails every test"""
+        try:
+            responses, response_time = self.predict_batch([image_path for image_path, _ in test_images])
+            if len(responses) != len(test_images):
+                raise Exception(f"Expected {len(test_images)} predictions, got {len(responses)}")
+        except Exception as e:
+            self.test_results.extend(
+                self._error_result(image_path, expected_class, e)
+                for image_path, expected_class in test_images
+            )
+            return self.test_results
+        
+        for (image_path, expected_class), response in zip(test_images, responses):
             try:
-                print(f"\nTesting image: {image_path}")
-                print(f"Expected class: {expected_class}")
-                
-                # Make prediction
-                response, response_time = self.predict(image_path)
-                predicted_class = response["class_id"]
-                confidence = response["confidence"]
-                
-                # Create test result
-                result = TestResult(
-                    image_path=image_path,
-                    expected_class=expected_class,
-                    predicted_class=predicted_class,
-                    confidence=confidence,
-                    response_time=response_time,
-                    success=(predicted_class == expected_class)
-                )
-                
-                # Print result
-                print(f"Predicted class: {predicted_class}")
-                print(f"Confidence: {confidence:.4f}")
-                print(f"Response time: {response_time:.3f}s")
-                print(f"Test {'passed' if result.success else 'failed'}")
-                
-                self.test_results.append(result)
-                
+                self.test_results.append(self._collect_result(image_path, expected_class, response, response_time))
             except Exception as e:
-                print(f"Error testing {image_path}: {str(e)}")
-                self.test_results.append(TestResult(
-                    image_path=image_path,
-                    expected_class=expected_class,
-                    predicted_class=-1,
-                    confidence=0.0,
-                    response_time=0.0,
-                    success=False,
-                    error=str(e)
-                ))
-        
+                self.test_results.append(self._error_result(image_path, expected_class, e))
         return self.test_results
     
+    def _collect_result(self, image_path: str, expected_class: int, response: Dict, response_time: float) -> TestResult:
+        """Turn one prediction response into a printed TestResult"""
+        predicted_class = response["class_id"]
+        confidence = response["confidence"]
+        
+        # Create test result
+        result = TestResult(
+            image_path=image_path,
+            expected_class=expected_class,
+            predicted_class=predicted_class,
+            confidence=confidence,
+            response_time=response_time,
+            success=(predicted_class == expected_class)
+        )
+        
+        # Print result
+        print(RESULT_TEMPLATE.format(
+            **result.__dict__,
+            status='passed' if result.success else 'failed'
+        ))
+        
+        return result
+    
+    def _error_result(self, image_path: str, expected_class: int, error: Exception) -> TestResult:
+        """Turn a failed prediction into a printed TestResult"""
+        print(ERROR_TEMPLATE.format(image_path=image_path, expected_class=expected_class, error=error))
+        return TestResult(
+            image_path=image_path,
+            expected_class=expected_class,
+            predicted_class=-1,
+            confidence=0.0,
+            response_time=0.0,
+            success=False,
+            error=str(error)
+        )
+    
+    def response_time_stats(self) -> Dict[str, float]:
+        """Summary statistics over all recorded response times"""
+        times = self._response_times[:self._num_response_times]
+        if not times.size:
+            return {"avg": 0.0, "min": 0.0, "max": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+        p50, p95, p99 = np.percentile(times, [50, 95, 99])
+        return {
+            "avg": float(times.mean()),
+            "min": float(times.min()),
+            "max": float(times.max()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99)
+        }
+    
     def generate_report(self, output_dir: str = "test_reports"):
         """
         Generate a test report with metrics and visualizations
@@ -162,7 +294,7 @@ class CerebriumTester:
         # Calculate metrics
         total_tests = len(self.test_results)
         successful_tests = sum(1 for r in self.test_results if r.success)
-        avg_response_time = self.metrics["total_response_time"] / self.metrics["total_requests"] if self.metrics["total_requests"] > 0 else 0
+        response_times = self.response_time_stats()
         
         # Generate report
         report = {
@@ -172,65 +304,73 @@ class CerebriumTester:
                 "successful_tests": successful_tests,
                 "failed_tests": total_tests - successful_tests,
                 "success_rate": (successful_tests / total_tests * 100) if total_tests > 0 else 0,
-                "avg_response_time": avg_response_time,
-                "min_response_time": self.metrics["min_response_time"],
-                "max_response_time": self.metrics["max_response_time"],
+                "avg_response_time": response_times["avg"],
+                "min_response_time": response_times["min"],
+                "max_response_time": response_times["max"],
+                "p50_response_time": response_times["p50"],
+                "p95_response_time": response_times["p95"],
+                "p99_response_time": response_times["p99"],
                 "total_requests": self.metrics["total_requests"],
                 "successful_requests": self.metrics["successful_requests"],
                 "failed_requests": self.metrics["failed_requests"]
             },
             "errors": self.metrics["errors"],
-            "test_results": [
-                {
-                    "image_path": r.image_path,
-                    "expected_class": r.expected_class,
-                    "predicted_class": r.predicted_class,
-                    "confidence": r.confidence,
-                    "response_time": r.response_time,
-                    "success": r.success,
-                    "error": r.error
-                }
-                for r in self.test_results
-            ]
+            # orjson serializes the TestResult dataclasses natively
+            "test_results": self.test_results
         }
         
         # Save report
         report_path = os.path.join(output_dir, f"test_report_{timestamp}.json")
-        with open(report_path, 'w') as f:
-            json.dump(report, f, indent=2)
+        with open(report_path, 'wb') as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
         
-        # Generate visualizations
-        self._generate_visualizations(output_dir, timestamp)
+        # Generate visualizations in the background; close() waits for them
+        if self._plot_pool is None:
+            self._plot_pool = ThreadPoolExecutor(max_workers=1)
+        plots = self._plot_pool.submit(self._generate_visualizations, output_dir, timestamp)
+        plots.add_done_callback(self._report_plot_error)
         
         print(f"\nTest report generated: {report_path}")
         return report_path
     
+    @staticmethod
+    def _report_plot_error(future):
+        """Print failures from the background plotting thread"""
+        if future.exception() is not None:
+            print(f"Error generating plots: {future.exception()}")
+    
     def _generate_visualizations(self, output_dir: str, timestamp: str):
         """Generate visualization plots for the test results"""
+        # Imported here so CLI runs that never plot skip matplotlib's import cost
+        from matplotlib.figure import Figure
+        
+        # One pyplot-free (Agg) figure, safe off the main thread and reused for both plots
+        fig = Figure(figsize=(10, 6))
+        
         # Response time distribution
         response_times = [r.response_time for r in self.test_results if r.success]
         if response_times:
-            plt.figure(figsize=(10, 6))
-            plt.hist(response_times, bins=20)
-            plt.title("Response Time Distribution")
-            plt.xlabel("Response Time (s)")
-            plt.ylabel("Frequency")
-            plt.savefig(os.path.join(output_dir, f"response_times_{timestamp}.png"))
-            plt.close()
+            ax = fig.subplots()
+            ax.hist(response_times, bins=20)
+            ax.set_title("Response Time Distribution")
+            ax.set_xlabel("Response Time (s)")
+            ax.set_ylabel("Frequency")
+            fig.savefig(os.path.join(output_dir, f"response_times_{timestamp}.png"))
+            fig.clear()
         
         # Success rate by image
         if self.test_results:
-            plt.figure(figsize=(12, 6))
+            fig.set_size_inches(12, 6)
+            ax = fig.subplots()
             image_names = [os.path.basename(r.image_path) for r in self.test_results]
             success_rates = [1 if r.success else 0 for r in self.test_results]
-            plt.bar(image_names, success_rates)
-            plt.title("Test Success Rate by Image")
-            plt.xlabel("Image")
-            plt.ylabel("Success (1) / Failure (0)")
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            plt.savefig(os.path.join(output_dir, f"success_rates_{timestamp}.png"))
-            plt.close()
+            ax.bar(image_names, success_rates)
+            ax.set_title("Test Success Rate by Image")
+            ax.set_xlabel("Image")
+            ax.set_ylabel("Success (1) / Failure (0)")
+            ax.tick_params(axis='x', labelrotation=45)
+            fig.tight_layout()
+            fig.savefig(os.path.join(output_dir, f"success_rates_{timestamp}.png"))
 
 def main():
     parser = argparse.ArgumentParser(description='Test deployed model on Cerebrium')
@@ -242,6 +382,8 @@ def main():
                       help='Paths to test images')
     parser.add_argument('--expected_classes', type=int, nargs='+',
                       help='Expected class IDs for test images')
+    parser.add_argument('--batch', action='store_true',
+                      help='Send all test images in one request to the batch endpoint')
     parser.add_argument('--output_dir', type=str, default='test_reports',
                       help='Directory to save test reports')
     
@@ -264,7 +406,7 @@ def main():
     
     try:
         # Run tests
-        results = tester.run_preset_tests(test_images)
+        results = tester.run_preset_tests(test_images, batch=args.batch)
         
         # Generate report
         report_path = tester.generate_report(args.output_dir)
@@ -274,11 +416,15 @@ def main():
         print(f"Total tests: {len(results)}")
         print(f"Successful tests: {sum(1 for r in results if r.success)}")
         print(f"Failed tests: {sum(1 for r in results if not r.success)}")
-        print(f"Average response time: {tester.metrics['total_response_time'] / tester.metrics['total_requests']:.3f}s")
+        response_times = tester.response_time_stats()
+        print(f"Average response time: {response_times['avg']:.3f}s")
+        print(f"p95 response time: {response_times['p95']:.3f}s")
         
     except Exception as e:
         print(f"Error running tests: {str(e)}")
         raise
+    finally:
+        tester.close()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,88 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+class MicroBatcher:
+    """Coalesces concurrent single-image requests into batched model calls."""
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], List[Tuple[int, float]]],
+        max_batch_size: int = 8,
+        max_latency_ms: float = 5.0,
+        executor: Optional[Executor] = None
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            predict_fn: Runs a stacked (N, ...) batch and returns one result per row
+            max_batch_size (int): Largest batch handed to predict_fn
+            max_latency_ms (float): Longest a request waits for others to join its batch
+            executor (Optional[Executor]): Pool running predict_fn (loop default if None)
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.executor = executor
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, input_data: np.ndarray) -> Tuple[int, float]:
+        """Queue one preprocessed (1, ...) input and wait for its prediction."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((input_data, future))
+        return await future
+
+    def _ensure_worker(self) -> None:
+        """Start the drain task; queue and task are rebuilt if the event loop changed."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def _next_batch(self) -> list:
+        """Wait for one item, then gather more until the batch is full or the deadline passes."""
+        items = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_latency
+        while len(items) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self) -> None:
+        while True:
+            items = await self._next_batch()
+
+            # Inputs only stack when shapes match (decode-only models take native sizes)
+            groups = {}
+            for item in items:
+                groups.setdefault(item[0].shape, []).append(item)
+            for group in groups.values():
+                await self._run_group(group)
+
+    async def _run_group(self, items: list) -> None:
+        # Stacking can fail too (e.g. 0-d inputs); it must reach callers, not kill the drain task
+        try:
+            batch = np.concatenate([input_data for input_data, _ in items], axis=0)
+            results = await self._loop.run_in_executor(self.executor, self.predict_fn, batch)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Callers that disconnected have already cancelled their future
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
@@ -1,19 +1,196 @@
 import os
 import sys
 import torch
+import torch.nn as nn
+import numpy as np
+import onnx
+import onnxoptimizer
+import onnxsim
+from onnxconverter_common import float16
 import argparse
 from pathlib import Path
+from typing import Dict, List, Optional
+from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_dynamic, quantize_static
 
 # Add the parent directory to the Python path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from pytorch_model import Classifier
+from src.model.model import ImagePreprocessor
+
+# ImageNet statistics used by the preprocessor
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Graph-level passes run on the exported model
+OPTIMIZER_PASSES = [
+    "eliminate_deadend",
+    "eliminate_identity",
+    "fuse_bn_into_conv",
+    "fuse_consecutive_transposes",
+    "fuse_add_bias_into_conv",
+    "fuse_matmul_add_bias_into_gemm",
+    "extract_constant_to_initializer",
+]
+
+def load_weights(model_path: str) -> Dict[str, torch.Tensor]:
+    """
+    Load a state dict with the checkpoint memory-mapped instead of read into RAM.
+    
+    Args:
+        model_path (str): Path to the PyTorch model weights
+        
+    Returns:
+        Dict[str, torch.Tensor]: Tensors only, no arbitrary pickled objects
+    """
+    try:
+        return torch.load(model_path, map_location='cpu', mmap=True, weights_only=True)
+    except TypeError:
+        # torch < 2.1 has no mmap argument
+        return torch.load(model_path, map_location='cpu', weights_only=True)
+
+class PixelOffsetModel(nn.Module):
+    """Subtracts the per-channel pixel mean before running the wrapped model."""
+
+    def __init__(self, model: nn.Module, offset: torch.Tensor):
+        super().__init__()
+        self.model = model
+        self.register_buffer('offset', offset.view(1, -1, 1, 1))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.model(x - self.offset)
+
+def fold_normalization(
+    model: Classifier,
+    mean: tuple = IMAGENET_MEAN,
+    std: tuple = IMAGENET_STD
+) -> nn.Module:
+    """
+    Fold the (x / 255 - mean) / std input normalization into the model.
+    
+    The per-channel 1 / (255 * std) scale is folded exactly into the first
+    conv's weights. The mean is kept as a single Sub at the graph input,
+    because conv1 zero-pads its input and folding the offset into a bias
+    would be wrong along the image borders.
+    
+    Args:
+        model (Classifier): Model whose first conv receives normalized input
+        mean (tuple): Per-channel mean in [0, 1] units
+        std (tuple): Per-channel std in [0, 1] units
+        
+    Returns:
+        nn.Module: Model taking raw 0-255 RGB pixel values
+    """
+    scale = 1.0 / (255.0 * torch.tensor(std))
+    with torch.no_grad():
+        model.conv1.weight.mul_(scale.view(1, -1, 1, 1))
+    return PixelOffsetModel(model, 255.0 * torch.tensor(mean))
+
+def optimize_onnx_model(
+    model_path: str,
+    passes: List[str] = OPTIMIZER_PASSES,
+    metadata: Optional[Dict[str, str]] = None
+) -> None:
+    """
+    Simplify an exported model with onnxsim, run onnxoptimizer passes and save it in place.
+    
+    Args:
+        model_path (str): Path to the ONNX model
+        passes (List[str]): onnxoptimizer passes to run
+        metadata (Optional[Dict[str, str]]): Extra metadata props to store in the model
+    """
+    # The exporter may write weights to a side file; note it before pulling the data in
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    model = onnx.load(model_path, load_external_data=False)
+    external_files = {
+        entry.value
+        for tensor in model.graph.initializer
+        if tensor.data_location == onnx.TensorProto.EXTERNAL
+        for entry in tensor.external_data
+        if entry.key == 'location'
+    }
+    onnx.external_data_helper.load_external_data_for_model(model, model_dir)
+    props = {prop.key: prop.value for prop in model.metadata_props}
+    
+    # Constant folding and shape inference; keep the exported graph if it can't be verified
+    simplified, ok = onnxsim.simplify(model)
+    if ok:
+        model = simplified
+    model = onnxoptimizer.optimize(model, passes)
+    
+    # onnxsim records its own run statistics as props; keep only ours
+    props.update(metadata or {})
+    onnx.helper.set_model_props(model, props)
+    onnx.save(model, model_path)
+    
+    # Weights are now stored inline, so the exporter's side file is stale
+    for location in external_files:
+        os.remove(os.path.join(model_dir, location))
+
+class ImageCalibrationDataReader(CalibrationDataReader):
+    """Feeds preprocessed images to the static quantizer for activation calibration."""
+
+    def __init__(self, image_paths: List[str], input_name: str = 'input', normalize: bool = True):
+        self.preprocessor = ImagePreprocessor(normalize=normalize)
+        self.input_name = input_name
+        self._image_paths = iter(image_paths)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        image_path = next(self._image_paths, None)
+        if image_path is None:
+            return None
+        return {self.input_name: self.preprocessor.preprocess(image_path)}
+
+def quantize_to_int8(
+    model_path: str,
+    output_path: str,
+    calibration_images: Optional[List[str]] = None,
+    normalize: bool = True
+) -> None:
+    """
+    Quantize an ONNX model to INT8.
+    
+    Uses static quantization (QInt8 weights, QUInt8 activations) when calibration
+    images are given, otherwise falls back to calibration-free dynamic quantization.
+    
+    Args:
+        model_path (str): Path to the FP32 ONNX model
+        output_path (str): Path where the INT8 model will be saved
+        calibration_images (Optional[List[str]]): Images used to calibrate activation ranges
+        normalize (bool): Whether the model expects ImageNet-normalized input
+    """
+    if calibration_images:
+        quantize_static(
+            model_path,
+            output_path,
+            ImageCalibrationDataReader(calibration_images, normalize=normalize),
+            weight_type=QuantType.QInt8,
+            activation_type=QuantType.QUInt8
+        )
+    else:
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+    print(f"INT8 model has been saved to {output_path}")
+
+def convert_to_fp16(model_path: str, output_path: str) -> None:
+    """
+    Convert an ONNX model's weights and activations to FP16.
+    
+    Graph inputs and outputs stay FP32, so preprocessing and callers are unchanged.
+    
+    Args:
+        model_path (str): Path to the FP32 ONNX model
+        output_path (str): Path where the FP16 model will be saved
+    """
+    model = float16.convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+    onnx.save(model, output_path)
+    print(f"FP16 model has been saved to {output_path}")
 
 def convert_to_onnx(
     model_path: str,
     output_path: str,
     input_shape: tuple = (1, 3, 224, 224),
-    opset_version: int = 12
+    opset_version: int = 17,
+    fold_input_normalization: bool = True
 ) -> None:
     """
     Convert PyTorch model to ONNX format.
@@ -23,15 +200,19 @@ def convert_to_onnx(
         output_path (str): Path where the ONNX model will be saved
         input_shape (tuple): Input shape for the model (batch_size, channels, height, width)
         opset_version (int): ONNX opset version to use
+        fold_input_normalization (bool): Fold ImageNet normalization into the graph so
+            the model takes raw 0-255 pixel values
     """
     # Initialize model
     model = Classifier()
     
     # Load weights
-    state_dict = torch.load(model_path, map_location=torch.device('cpu'))
-    model.load_state_dict(state_dict)
+    model.load_state_dict(load_weights(model_path))
     model.eval()
     
+    if fold_input_normalization:
+        model = fold_normalization(model)
+    
     # Create dummy input
     dummy_input = torch.randn(input_shape)
     
@@ -50,6 +231,12 @@ def convert_to_onnx(
             'output': {0: 'batch_size'}
         }
     )
+    
+    # Fuse BN/bias ops and drop dead nodes; tag the input contract for ONNXModel
+    optimize_onnx_model(
+        output_path,
+        metadata={"normalization": "embedded"} if fold_input_normalization else None
+    )
     print(f"Model has been converted to ONNX and saved to {output_path}")
 
 def main():
@@ -58,10 +245,20 @@ def main():
                       help='Path to the PyTorch model weights')
     parser.add_argument('--output_path', type=str, required=True,
                       help='Path where the ONNX model will be saved')
-    parser.add_argument('--opset_version', type=int, default=12,
+    parser.add_argument('--opset_version', type=int, default=17,
                       help='ONNX opset version to use')
+    parser.add_argument('--keep_normalization', action='store_true',
+                      help='Keep ImageNet normalization in the preprocessor instead of the graph')
+    parser.add_argument('--quantize', choices=['none', 'dynamic', 'static'], default='none',
+                      help='Also save an INT8-quantized model next to the output (*.int8.onnx)')
+    parser.add_argument('--fp16', action='store_true',
+                      help='Also save an FP16 model next to the output (*.fp16.onnx), for GPU serving')
+    parser.add_argument('--calibration_dir', type=str, default=None,
+                      help='Directory of images for static INT8 calibration')
     
     args = parser.parse_args()
+    if args.quantize == 'static' and not args.calibration_dir:
+        parser.error('--quantize static requires --calibration_dir')
     
     # Create output directory if it doesn't exist
     os.makedirs(os.path.dirname(args.output_path), exist_ok=True)
@@ -69,8 +266,26 @@ def main():
     convert_to_onnx(
         model_path=args.model_path,
         output_path=args.output_path,
-        opset_version=args.opset_version
+        opset_version=args.opset_version,
+        fold_input_normalization=not args.keep_normalization
     )
+    
+    if args.fp16:
+        convert_to_fp16(args.output_path, str(Path(args.output_path).with_suffix('.fp16.onnx')))
+    
+    if args.quantize != 'none':
+        calibration_images = None
+        if args.quantize == 'static':
+            calibration_images = sorted(
+                str(path) for path in Path(args.calibration_dir).iterdir()
+                if path.suffix.lower() in ('.jpg', '.jpeg', '.png')
+            )
+        quantize_to_int8(
+            args.output_path,
+            str(Path(args.output_path).with_suffix('.int8.onnx')),
+            calibration_images=calibration_images,
+            normalize=args.keep_normalization
+        )
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()